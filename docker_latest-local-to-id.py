@@ -4,10 +4,11 @@
 docker_latest-local-to-id.py
 Ermittelt den/die lokalen Repo-Digest(s) eines Images via:
   docker image inspect <repo[:tag]>
+(direkt über die Docker Engine API am UNIX-Socket, Fallback: docker CLI)
 und mappt diese Digests auf die zugehörigen Tags/Versionen auf Docker Hub.
 
 Aufruf:
-  python3 docker_latest-local-to-id.py <repo[:tag]> [--scan-all] [--max-pages N] [-v] [--json]
+  python3 docker_latest-local-to-id.py <repo[:tag]> [--scan-all] [--max-pages N] [--no-cache] [-v] [--json]
 
 Beispiele:
   python3 docker_latest-local-to-id.py ollama/ollama:latest
@@ -16,19 +17,44 @@ Beispiele:
 """
 
 import argparse
+import datetime
+import email.utils
+import functools
+import http.client
 import json
 import logging
+import math
+import operator
+import os
 import re
+import socket
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 import urllib.parse
-import urllib.request
-from typing import List, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import AbstractSet, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Set, Tuple
 
 LOG = logging.getLogger("local-image-revlookup")
-HUB_BASE = "https://hub.docker.com/v2/repositories/{repo}/tags/?page_size=100"
-SEMVER_RX = re.compile(r"^v?\d+\.\d+\.\d+(?:[.-].+)?$")
+USER_AGENT = "local-revlookup/1.1"
+HUB_PAGE_SIZE = 100
+# ordering=last_updated: zuletzt gepushte Tags zuerst – ein lokales ':latest' steht damit meist auf Seite 1
+HUB_BASE = "https://hub.docker.com/v2/repositories/{repo}/tags/?page_size=%d&ordering=last_updated" % HUB_PAGE_SIZE
+HUB_TAG_URL = "https://hub.docker.com/v2/repositories/{repo}/tags/{tag}/"
+HUB_WORKERS = 8
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+RETRY_AFTER_MAX = 60
+REDIRECT_STATUS = frozenset({301, 302, 303, 307, 308})
+MAX_REDIRECTS = 5
+DOCKER_SOCKET = "/var/run/docker.sock"
+CACHE_NAME = "local-revlookup"
+TAG_CACHE_FILE = "tags.json"
+CACHE_TTL = 24 * 3600
+ETAG_CACHE_FILE = "etags.json"
+ETAG_TTL = 7 * 24 * 3600
+SEMVER_RX = re.compile(r"^v?(\d+)\.(\d+)\.(\d+)(?:[.-](.+))?$")
 
 
 # ---------- Hilfe & Beispiele ----------
@@ -59,6 +85,7 @@ Beispielausgabe (typisch) für 'ollama/ollama:latest':
 Hinweise:
   * Container muss NICHT laufen, aber der Docker-Daemon muss aktiv sein.
   * Wenn '.RepoDigests' leer ist (z. B. selbst gebautes Image), kann kein zuverlässiges Tag-Mapping erfolgen.
+  * Gefundene Digest→Tag-Zuordnungen werden 24 h in ~/.cache/local-revlookup gemerkt (--no-cache schaltet das ab).
 """.rstrip())
 
 
@@ -74,6 +101,15 @@ def setup_logging(debug: bool):
 
 # ---------- helpers ----------
 
+def emit(lines: List[str]) -> None:
+    """Gibt alle Zeilen mit einem einzigen write() auf stdout aus."""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+def emit_json(payload: dict) -> None:
+    sys.stdout.write(json.dumps(payload, indent=2, ensure_ascii=False) + "\n")
+
+
 def normalize_repo(ref: str) -> Tuple[str, str]:
     """Entfernt docker.io/… Präfixe, setzt default tag=latest, fügt library/ bei offiziellen Images hinzu."""
     for p in ("docker.io/", "index.docker.io/", "registry-1.docker.io/"):
@@ -97,104 +133,495 @@ def run(cmd: List[str]) -> subprocess.CompletedProcess:
     return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
 
-def fetch_json(url: str, timeout=15, retries=5, backoff=1.5):
-    att = 0
-    last = None
-    while att <= retries:
-        att += 1
-        LOG.debug("GET %s (try %d/%d)", url, att, retries + 1)
+class HubSession:
+    """
+    Minimaler Keep-Alive-HTTP-Client auf Basis von http.client (nur stdlib).
+    Hält je Host und Thread eine offene HTTPS-Verbindung, damit bei der Pagination
+    nicht pro Seite ein neuer TCP-/TLS-Handshake anfällt (http.client-Verbindungen
+    sind nicht threadsicher, daher eine pro Worker-Thread).
+    """
+
+    def __init__(self, timeout: float = 15, retries: int = 5, backoff: float = 1.5, etags: dict | None = None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # {url: {"etag": …, "page": HubPage-als-Liste, "ts": …}} für bedingte GETs; None = aus
+        self.etags = etags
+        self.etags_changed = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[http.client.HTTPSConnection] = []
+
+    def _conns(self) -> Dict[str, http.client.HTTPSConnection]:
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        return conns
+
+    def _conn(self, host: str) -> http.client.HTTPSConnection:
+        conns = self._conns()
+        conn = conns.get(host)
+        if conn is None:
+            conn = http.client.HTTPSConnection(host, timeout=self.timeout)
+            conns[host] = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def _drop(self, host: str) -> None:
+        conn = self._conns().pop(host, None)
+        if conn is not None:
+            conn.close()
+
+    def _get_once(self, host: str, path: str, headers: Dict[str, str]) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        conn = self._conn(host)
         try:
-            with urllib.request.urlopen(
-                urllib.request.Request(url, headers={"User-Agent": "local-revlookup/1.1"}),
-                timeout=timeout,
-            ) as resp:
-                return json.loads(resp.read().decode("utf-8", errors="replace"))
-        except Exception as e:
-            last = e
-            time.sleep(min(backoff**att, 8))
-    raise RuntimeError(f"HTTP-Fehler bei Abruf {url}: {last}") from last
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            # Verbindung ist (z. B. nach Keep-Alive-Timeout) unbrauchbar → beim nächsten Versuch neu aufbauen
+            self._drop(host)
+            raise
+        if resp.will_close:
+            self._drop(host)
+        return resp.status, resp.headers, body
+
+    def get(self, url: str, headers: Dict[str, str] | None = None) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        """
+        GET auf url über die gepoolte Verbindung. Gibt (Status, Header, Body) zurück.
+        Verbindungsfehler und RETRY_STATUS werden mit exponentiellem Backoff wiederholt;
+        bei 429/503 wird ein 'Retry-After'-Header des Servers respektiert.
+        HTTPS-Redirects (3xx mit Location) werden bis zu MAX_REDIRECTS-mal verfolgt.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            status, resp_headers, body = self._get_with_retries(url, headers)
+            location = resp_headers.get("Location")
+            if status not in REDIRECT_STATUS or not location:
+                return status, resp_headers, body
+            target = urllib.parse.urljoin(url, location)
+            if urllib.parse.urlsplit(target).scheme != "https":
+                raise RuntimeError(f"HTTP-Fehler bei Abruf {url}: Redirect auf Nicht-HTTPS-Ziel {target}")
+            LOG.debug("HTTP %d – Redirect %s → %s", status, url, target)
+            url = target
+        raise RuntimeError(f"HTTP-Fehler bei Abruf {url}: mehr als {MAX_REDIRECTS} Redirects")
+
+    def _get_with_retries(
+        self, url: str, headers: Dict[str, str] | None
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        req_headers = {"User-Agent": USER_AGENT, "Accept": "application/json", **(headers or {})}
+
+        att = 0
+        while True:
+            att += 1
+            LOG.debug("GET %s (try %d/%d)", url, att, self.retries + 1)
+            try:
+                status, resp_headers, body = self._get_once(parts.netloc, path, req_headers)
+            except (OSError, http.client.HTTPException) as e:
+                if att > self.retries:
+                    raise RuntimeError(f"HTTP-Fehler bei Abruf {url}: {e}") from e
+                time.sleep(min(self.backoff**att, 8))
+                continue
+
+            if status not in RETRY_STATUS or att > self.retries:
+                return status, resp_headers, body
+            wait = parse_retry_after(resp_headers.get("Retry-After"))
+            if wait is None:
+                wait = min(self.backoff**att, 8)
+            elif wait > RETRY_AFTER_MAX:
+                LOG.warning("Hub verlangt Retry-After=%ds (> %ds). Breche ab.", wait, RETRY_AFTER_MAX)
+                return status, resp_headers, body
+            LOG.debug("HTTP %d – warte %.1fs vor erneutem Versuch", status, wait)
+            time.sleep(wait)
+
+    def cached_etag(self, url: str) -> Tuple[str, "HubPage"] | None:
+        """(ETag, HubPage) aus dem ETag-Cache. Unvollständige/kaputte Einträge werden ignoriert."""
+        if self.etags is None:
+            return None
+        with self._lock:
+            entry = self.etags.get(url)
+        if not isinstance(entry, dict):
+            return None
+        etag = entry.get("etag")
+        page = hub_page_from_json(entry.get("page"))
+        if not isinstance(etag, str) or not etag or page is None:
+            return None
+        return etag, page
+
+    def remember_etag(self, url: str, etag: str, page: "HubPage") -> None:
+        if self.etags is None:
+            return
+        with self._lock:
+            self.etags[url] = {"etag": etag, "page": [page.count, page.next, page.results], "ts": time.time()}
+            self.etags_changed = True
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """'Retry-After' als Sekunden (Zahl oder HTTP-Datum). None, wenn nicht vorhanden/ungültig."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def fetch_json(session: HubSession, url: str):
+    status, _, body = session.get(url)
+    return decode_json_response(url, status, body)
+
+
+def decode_json_response(url: str, status: int, body: bytes):
+    # 304 wird vorab in fetch_tag_page behandelt; Redirects verfolgt HubSession.get
+    if status >= 300:
+        raise RuntimeError(f"HTTP-Fehler bei Abruf {url}: HTTP {status}")
+    try:
+        return json.loads(body.decode("utf-8", errors="replace"))
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Ungültiges JSON bei Abruf {url}: {e}") from e
 
 
 def split_latest_versions(tags: Set[str]):
+    """Teilt Tags in latest / Versionen / sonstige. Versionen werden numerisch sortiert (1.9.0 < 1.10.0)."""
     latest, versions, others = [], [], []
     for t in tags:
         if t == "latest":
             latest.append(t)
-        elif SEMVER_RX.match(t or ""):
-            versions.append(t)
+            continue
+        # Schneller Vorfilter: nur Tags, die mit Ziffer oder 'v<Ziffer>' beginnen, können passen
+        first = t[:1]
+        m = None
+        if first.isdigit() or (first == "v" and t[1:2].isdigit()):
+            m = SEMVER_RX.match(t)
+        if m:
+            versions.append((tuple(int(x) for x in m.group(1, 2, 3)), m.group(4) or "", t))
         else:
             others.append(t)
     versions.sort()
     others.sort()
-    return latest, versions, others
+    return latest, [t for _, _, t in versions], others
 
 
 # ---------- core: local digest(s) ----------
 
-def get_local_repo_digests_via_docker_inspect(user_ref: str, hub_repo: str) -> Tuple[Set[str], str | None]:
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection über einen UNIX-Socket (Docker Engine API)."""
+
+    def __init__(self, socket_path: str, timeout: float = 10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def docker_socket_path() -> str | None:
+    """Pfad zum Docker-Socket (DOCKER_HOST=unix://… oder Default). None bei tcp://, ssh:// o. Ä."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if not host:
+        return DOCKER_SOCKET
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    return None
+
+
+class DockerAPIUnavailable(Exception):
+    """Docker Engine API antwortet unbrauchbar (kein 200/404) – Fallback auf die docker CLI."""
+
+
+def inspect_image_via_socket(user_ref: str) -> Tuple[List[str], str | None]:
     """
-    Holt .RepoDigests via docker image inspect. Gibt ein Set von sha256:* (Manifest-Digests) zurück.
-    Zusätzlich wird .Id zurückgegeben (Config-Digest), falls RepoDigests leer sind.
+    Liest RepoDigests und Id direkt über die Docker Engine API (GET /images/{ref}/json)
+    statt über einen docker-CLI-Prozess. Der Pfad ist unversioniert, damit der Daemon
+    seine eigene API-Version verwendet (neuere Engines lehnen zu alte Versionen ab).
+    Wirft OSError (Socket fehlt, keine Rechte, Timeout …) oder DockerAPIUnavailable,
+    wenn der Socket nicht nutzbar ist; RuntimeError nur bei 404 (Image unbekannt).
     """
-    # 1) RepoDigests
-    cp = run(["docker", "image", "inspect", user_ref, "--format", "{{json .RepoDigests}}"])
+    path = docker_socket_path()
+    if path is None:
+        raise FileNotFoundError("DOCKER_HOST zeigt nicht auf einen UNIX-Socket")
+    url = f"/images/{urllib.parse.quote(user_ref, safe='/:@')}/json"
+    LOG.debug("DOCKER API: GET unix://%s%s", path, url)
+    conn = UnixHTTPConnection(path)
+    try:
+        conn.request("GET", url, headers={"User-Agent": USER_AGENT})
+        resp = conn.getresponse()
+        body = resp.read()
+    except http.client.HTTPException as e:
+        raise DockerAPIUnavailable(f"ungültige HTTP-Antwort: {e}") from e
+    finally:
+        conn.close()
+
+    try:
+        data = json.loads(body.decode("utf-8", errors="replace") or "{}")
+    except json.JSONDecodeError:
+        data = None
+    if resp.status == 404 and isinstance(data, dict):
+        raise RuntimeError(data.get("message") or f"Docker-API HTTP {resp.status}")
+    if resp.status != 200 or not isinstance(data, dict):
+        message = data.get("message") if isinstance(data, dict) else body[:200]
+        raise DockerAPIUnavailable(f"HTTP {resp.status}: {message!r}")
+    return data.get("RepoDigests") or [], data.get("Id") or None
+
+
+def inspect_image_via_cli(user_ref: str) -> Tuple[List[str], str | None]:
+    """Fallback: RepoDigests und .Id in einem einzigen docker-image-inspect-Aufruf holen."""
+    cp = run(["docker", "image", "inspect", user_ref, "--format", "{{json .RepoDigests}}|{{.Id}}"])
     if cp.returncode != 0:
         raise RuntimeError(cp.stderr.strip() or cp.stdout.strip())
 
+    repo_digests_json, sep, id_str = cp.stdout.strip().rpartition("|")
     try:
-        repo_digests = json.loads(cp.stdout.strip() or "[]")
-    except json.JSONDecodeError:
+        if not sep:
+            raise ValueError("Trenner '|' fehlt")
+        # 'null' (keine RepoDigests) ist gültig und bedeutet leer
+        repo_digests = json.loads(repo_digests_json or "[]")
+    except ValueError:
         raise RuntimeError(f"Unerwartete Ausgabe von docker inspect: {cp.stdout!r}")
+    return repo_digests or [], id_str.strip() or None
+
+
+@functools.lru_cache(maxsize=32)
+def repo_variant_prefixes(hub_repo: str) -> Tuple[str, ...]:
+    """Alle Repo-Varianten, wie sie in RepoDigests vorkommen können, als '<repo>@'-Präfixe für str.startswith."""
+    # offizielle Images erscheinen als 'ubuntu@…', aber auch als 'docker.io/library/ubuntu@…'
+    names = dict.fromkeys((repo_for_output(hub_repo), hub_repo))
+    return tuple(
+        f"{host}{name}@"
+        for name in names
+        for host in ("", "docker.io/", "index.docker.io/", "registry-1.docker.io/")
+    )
 
-    LOG.debug("RepoDigests raw: %s", repo_digests)
 
-    # Repo-Varianten, wie sie in RepoDigests vorkommen können
-    short = repo_for_output(hub_repo)
-    variants = {
-        short,
-        f"docker.io/{short}",
-        f"index.docker.io/{short}",
-        f"registry-1.docker.io/{short}",
-    }
+_INSPECT_CACHE: Dict[Tuple[str, str], Tuple[FrozenSet[str], str | None]] = {}
+
 
+def get_local_repo_digests_via_docker_inspect(user_ref: str, hub_repo: str) -> Tuple[FrozenSet[str], str | None]:
+    """
+    Holt .RepoDigests via Docker Engine API (UNIX-Socket), ersatzweise via docker image inspect.
+    Gibt ein (unveränderliches) Set von sha256:* (Manifest-Digests) zurück.
+    Zusätzlich wird .Id zurückgegeben (Config-Digest), falls RepoDigests leer sind.
+    Ergebnisse werden pro (user_ref, hub_repo) für die Laufzeit des Prozesses gemerkt.
+    """
+    cached = _INSPECT_CACHE.get((user_ref, hub_repo))
+    if cached is not None:
+        LOG.debug("Inspect-Ergebnis für %s aus Cache", user_ref)
+        return cached
+
+    try:
+        repo_digests, local_id = inspect_image_via_socket(user_ref)
+    except (OSError, DockerAPIUnavailable) as e:
+        LOG.debug("Docker-Socket nicht nutzbar (%s) – Fallback auf docker CLI.", e)
+        repo_digests, local_id = inspect_image_via_cli(user_ref)
+
+    LOG.debug("RepoDigests raw: %s", repo_digests)
+
+    prefixes = repo_variant_prefixes(hub_repo)
     matched: Set[str] = set()
     for entry in repo_digests or []:
         # Beispiel: "ollama/ollama@sha256:..."
-        if "@sha256:" not in entry:
+        if not entry.startswith(prefixes):
             continue
-        left, digest = entry.split("@", 1)
-        if any(left.endswith(v) for v in variants):
+        digest = entry.split("@", 1)[1]
+        if digest.startswith("sha256:"):
             matched.add(digest)
 
-    # 2) .Id als Fallback merken (Config-Digest)
-    cp_id = run(["docker", "image", "inspect", user_ref, "--format", "{{.Id}}"])
-    local_id = cp_id.stdout.strip() if cp_id.returncode == 0 else None
+    # .Id als Fallback merken (Config-Digest)
     if local_id and local_id.startswith("sha256:"):
         LOG.debug(".Id (config) = %s", local_id)
 
-    return matched, local_id
+    result = (frozenset(matched), local_id)
+    _INSPECT_CACHE[(user_ref, hub_repo)] = result
+    return result
 
 
 # ---------- docker hub mapping ----------
 
+@functools.cache
+def quote_hub_repo(hub_repo: str) -> str:
+    """'library/ubuntu' → 'library%2Fubuntu' (einmal pro Repo berechnet)."""
+    return urllib.parse.quote(hub_repo, safe="")
+
+
+@functools.cache
+def hub_tags_url(hub_repo: str) -> str:
+    """Erste /tags/-Seite (page_size, ordering) für hub_repo (einmal pro Repo berechnet)."""
+    return HUB_BASE.format(repo=quote_hub_repo(hub_repo))
+
+
+_NAME_DIGEST_IMAGES = operator.itemgetter("name", "digest", "images")
+_DIGEST = operator.itemgetter("digest")
+
+
+class HubPage(NamedTuple):
+    """Auf das Nötige reduzierte Hub-/tags/-Seite: je Tag nur Name und Digests (Manifest + images[])."""
+    count: int | None
+    next: str | None
+    results: Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+
+def hub_page_from_json(value) -> HubPage | None:
+    """HubPage aus der JSON-Form im ETag-Cache ([count, next, [[name, [digest, …]], …]]); None bei falscher Form."""
+    try:
+        count, next_url, results = value
+        if not (count is None or isinstance(count, int)) or not (next_url is None or isinstance(next_url, str)):
+            return None
+        items = []
+        for name, digests in results:
+            if not isinstance(name, str) or isinstance(digests, str) or not all(isinstance(d, str) for d in digests):
+                return None
+            items.append((name, tuple(digests)))
+    except (TypeError, ValueError):
+        return None
+    return HubPage(count, next_url, tuple(items))
+
+
+def iter_page_results(data: dict) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+    """Liefert je Tag-Objekt einer Hub-Seite (name, digests) – ohne die übrigen Felder weiterzureichen."""
+    get_name_digest_images = _NAME_DIGEST_IMAGES
+    get_digest = _DIGEST
+    for obj in data.get("results") or []:
+        try:
+            name, dtop, images = get_name_digest_images(obj)
+            digests = [dtop, *map(get_digest, images)]
+        except (KeyError, TypeError):
+            # unvollständiger Eintrag (Feld fehlt / None) → toleranter Pfad mit .get()
+            digests = [obj.get("digest")]
+            digests.extend(img.get("digest") for img in obj.get("images") or [])
+            name = obj.get("name")
+        yield name, tuple(d for d in digests if d)
+
+
+@functools.lru_cache(maxsize=256)
+def fetch_tag_page(session: HubSession, url: str) -> HubPage:
+    """
+    Lädt eine Hub-/tags/-Seite und reduziert sie sofort auf HubPage. Das volle JSON
+    wird danach verworfen; memoisiert werden (pro Lauf) nur die kleinen HubPage-Tupel.
+    Ist für die URL ein ETag bekannt, wird bedingt abgefragt (If-None-Match); bei
+    '304 Not Modified' kommt die Seite aus dem ETag-Cache.
+    """
+    cached = session.cached_etag(url)
+    status, headers, body = session.get(url, {"If-None-Match": cached[0]} if cached else None)
+    if status == 304 and cached:
+        LOG.debug("304 Not Modified – Seite aus ETag-Cache: %s", url)
+        etag, page = cached
+        session.remember_etag(url, etag, page)  # Eintrag als weiterhin gültig markieren
+        return page
+
+    data = decode_json_response(url, status, body)
+    count = data.get("count")
+    page = HubPage(
+        count if isinstance(count, int) else None,
+        data.get("next") or None,
+        tuple(iter_page_results(data)),
+    )
+    etag = headers.get("ETag")
+    if etag:
+        session.remember_etag(url, etag, page)
+    return page
+
+
+def match_page_results(
+    results: Iterable[Tuple[str, Tuple[str, ...]]],
+    target_digests: AbstractSet[str],
+    exclude: str | None = None
+) -> Tuple[Set[str], Set[str]]:
+    """
+    Gibt (Tag-Namen, getroffene Digests) einer Hub-Seite zurück: alle Tags, die auf
+    einen der target_digests zeigen, und welche der target_digests dabei durch einen
+    Tag ungleich exclude (i. d. R. der angefragte Tag) gefunden wurden.
+    """
+    name_by_digest: Dict[str, List[str]] = {}
+    index = name_by_digest.setdefault
+    for name, digests in results:
+        for d in digests:
+            index(d, []).append(name)
+    matched = name_by_digest.keys() & target_digests
+    names: Set[str] = set()
+    add_names = names.update
+    found: Set[str] = set()
+    for d in matched:
+        tag_names = name_by_digest[d]
+        add_names(tag_names)
+        if exclude is None or any(n != exclude for n in tag_names):
+            found.add(d)
+    return names, found
+
+
 def collect_hub_tags_for_digests(
+    session: HubSession,
     hub_repo: str,
-    target_digests: Set[str],
+    target_digests: AbstractSet[str],
     *,
     scan_all: bool = False,
-    max_pages: int = 10
-) -> Set[str]:
+    max_pages: int = 10,
+    workers: int = HUB_WORKERS,
+    tag: str | None = None,
+    stop_when_complete: bool = False
+) -> Tuple[Set[str], bool]:
     """
     Sucht auf Docker Hub nach Tags, die auf einen der target_digests zeigen.
+    Gibt (Tags, exhausted) zurück; exhausted=True nur, wenn tatsächlich bis zur letzten
+    Tag-Seite gescannt wurde (kein Early-Exit, kein max_pages-/Pagination-Abbruch).
+    - tag: der angefragte Tag (z. B. 'latest'); wird vorab einzeln über den
+      Tag-Endpunkt geprüft. Ist er eine Version und passt, entfällt die Pagination
+      (bei scan_all=False); sonst zählt er nicht als "erster Treffer".
     - scan_all=False (Default): stoppt nach dem ersten Treffer (schnell)
-    - scan_all=True: scannt alle Seiten (vollständige Liste)
+    - scan_all=True: scannt alle Seiten (vollständige Liste); nach Seite 1 wird
+      anhand von 'count' die Seitenzahl bestimmt und der Rest parallel geladen
     - max_pages: harte Obergrenze für Anzahl Seiten (Sicherheitsnetz)
+    - stop_when_complete: bei scan_all abbrechen, sobald JEDER target_digest mindestens
+      einen Tag außer dem angefragten hat (weitere Seiten liefern dann nur noch Aliase);
+      ohne scan_all wirkungslos
     """
-    base = HUB_BASE.format(repo=urllib.parse.quote(hub_repo, safe=""))
+    stop_when_complete = scan_all and stop_when_complete
+    base = hub_tags_url(hub_repo)
     url = base
     hits: Set[str] = set()
+    matched_digests: Set[str] = set()
     visited = set()
     page = 0
+    exhausted = False
+
+    if tag:
+        tag_url = HUB_TAG_URL.format(repo=quote_hub_repo(hub_repo), tag=urllib.parse.quote(tag, safe=""))
+        try:
+            tag_data = fetch_json(session, tag_url)
+        except RuntimeError as e:
+            LOG.debug("Tag-Endpunkt für '%s' nicht nutzbar (%s) – nur Pagination.", tag, e)
+        else:
+            names, _ = match_page_results(iter_page_results({"results": [tag_data]}), target_digests)
+            if names:
+                hits.add(tag)  # zählt nicht für stop_when_complete – gesucht ist der *andere* Tag
+                if not scan_all and SEMVER_RX.match(tag):
+                    LOG.debug("Angefragter Tag '%s' passt – keine Pagination nötig (scan_all=False).", tag)
+                    return hits, False
+                LOG.debug("Angefragter Tag '%s' passt – suche weitere Tags.", tag)
+            else:
+                LOG.debug("Angefragter Tag '%s' zeigt auf Hub nicht (mehr) auf den lokalen Digest.", tag)
 
     while url:
         if url in visited:
@@ -206,38 +633,144 @@ def collect_hub_tags_for_digests(
             LOG.warning("max_pages=%d erreicht. Breche Suche ab.", max_pages)
             break
 
-        data = fetch_json(url)
-        res = data.get("results", [])
-        page_hits = 0
+        data = fetch_tag_page(session, url)
+        names, digests = match_page_results(data.results, target_digests, tag)
 
-        for obj in res:
-            name = obj.get("name")
-            dtop = obj.get("digest") or ""
-            matched = False
+        new_names = names - hits - {tag}  # angefragter Tag zählt nicht als "erster Treffer"
+        hits |= names
+        matched_digests |= digests
+        if new_names and not scan_all:
+            LOG.debug("Erster Treffer %s auf Seite %d – breche Suche ab (scan_all=False).",
+                      ", ".join(sorted(new_names)), page)
+            return hits, False  # sofort zurück
 
-            if dtop in target_digests:
-                matched = True
-            else:
-                for img in obj.get("images") or []:
-                    d = img.get("digest") or ""
-                    if d in target_digests:
-                        matched = True
-                        break
-
-            if matched:
-                hits.add(name)
-                page_hits += 1
-                if not scan_all:
-                    LOG.debug("Erster Treffer '%s' auf Seite %d – breche Suche ab (scan_all=False).", name, page)
-                    return hits  # sofort zurück
-
-        LOG.debug("Hub Seite %d: %d Treffer", page, page_hits)
-        next_url = data.get("next")
+        LOG.debug("Hub Seite %d: %d Treffer", page, len(names))
+        if stop_when_complete and matched_digests >= target_digests:
+            LOG.debug("Alle Digests zugeordnet nach Seite %d – breche Suche ab (stop_when_complete).", page)
+            break
+        next_url = data.next
         if not next_url:
+            exhausted = True
+            break
+
+        count = data.count
+        if scan_all and page == 1 and count is not None:
+            # Seitenzahl ist bekannt → restliche Seiten parallel statt über 'next' nacheinander laden
+            pages = math.ceil(count / HUB_PAGE_SIZE)
+            if pages > max_pages:
+                LOG.warning("max_pages=%d erreicht (%d Seiten vorhanden). Breche Suche ab.", max_pages, pages)
+            urls = [f"{base}&page={i}" for i in range(2, min(pages, max_pages) + 1)]
+            exhausted = pages <= max_pages
+            if urls:
+                workers = max(1, min(workers, len(urls)))
+                # mit stop_when_complete in Wellen zu je 'workers' Seiten laden, damit nach jeder Welle
+                # abgebrochen werden kann; sonst alle Seiten auf einmal einreihen
+                batch = workers if stop_when_complete else len(urls)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for start in range(0, len(urls), batch):
+                        pages_data = pool.map(lambda u: fetch_tag_page(session, u), urls[start:start + batch])
+                        for i, data in enumerate(pages_data, start=start + 2):
+                            names, digests = match_page_results(data.results, target_digests, tag)
+                            hits |= names
+                            matched_digests |= digests
+                            LOG.debug("Hub Seite %d: %d Treffer", i, len(names))
+                        if stop_when_complete and matched_digests >= target_digests:
+                            LOG.debug("Alle Digests zugeordnet nach Seite %d – breche Suche ab (stop_when_complete).", i)
+                            exhausted = exhausted and start + batch >= len(urls)
+                            break
             break
+
         url = next_url
 
-    return hits
+    return hits, exhausted
+
+
+# ---------- disk cache ----------
+
+def cache_dir() -> str:
+    """~/.cache/local-revlookup (bzw. $XDG_CACHE_HOME/local-revlookup)."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, CACHE_NAME)
+
+
+def load_json_cache(filename: str) -> dict:
+    """Liest eine JSON-Cache-Datei aus cache_dir(). Fehlende/kaputte Dateien ergeben einen leeren Cache."""
+    path = os.path.join(cache_dir(), filename)
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        LOG.debug("Cache %s nicht lesbar (%s) – ignoriere.", path, e)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_json_cache(filename: str, data: dict) -> None:
+    """Schreibt eine JSON-Cache-Datei atomar (tmp-Datei + os.replace). Fehler werden nur geloggt."""
+    directory = cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{filename}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, ensure_ascii=False)
+            os.replace(tmp, os.path.join(directory, filename))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError as e:
+        LOG.debug("Cache %s nicht schreibbar (%s) – ignoriere.", filename, e)
+
+
+def cache_entry_ts(entry) -> float | None:
+    """Zeitstempel 'ts' eines Cache-Eintrags; None, wenn der Eintrag kein dict oder 'ts' keine Zahl ist."""
+    if not isinstance(entry, dict):
+        return None
+    ts = entry.get("ts")
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)):
+        return None
+    return ts
+
+
+def prune_json_cache(cache: dict, ttl: float) -> None:
+    """Entfernt Einträge, deren 'ts' älter als ttl Sekunden ist oder die kaputt sind (kein dict, 'ts' keine Zahl)."""
+    now = time.time()
+    for key in list(cache):
+        ts = cache_entry_ts(cache[key])
+        if ts is None or now - ts > ttl:
+            del cache[key]
+
+
+def lookup_cached_tags(cache: dict, hub_repo: str, digests: Iterable[str], *, scan_all: bool) -> Set[str] | None:
+    """
+    Liefert die gemerkten Tags, wenn für ALLE digests ein frischer Eintrag (< CACHE_TTL) existiert.
+    Bei scan_all werden nur Einträge akzeptiert, die aus einem vollständigen Scan stammen.
+    """
+    now = time.time()
+    tags: Set[str] = set()
+    for digest in digests:
+        entry = cache.get(f"{hub_repo}@{digest}")
+        # kaputte Einträge (ts keine Zahl, tags keine Liste von Strings) zählen als Cache-Miss
+        ts = cache_entry_ts(entry)
+        if ts is None or now - ts > CACHE_TTL:
+            return None
+        entry_tags = entry.get("tags")
+        if not isinstance(entry_tags, list) or not all(isinstance(t, str) for t in entry_tags):
+            return None
+        if scan_all and entry.get("complete") is not True:
+            return None
+        tags.update(entry_tags)
+    return tags or None
+
+
+def store_cached_tags(cache: dict, hub_repo: str, digests: Iterable[str], tags: Set[str], *, complete: bool) -> None:
+    now = time.time()
+    for digest in digests:
+        cache[f"{hub_repo}@{digest}"] = {"tags": sorted(tags), "complete": complete, "ts": now}
+    # abgelaufene Einträge bei der Gelegenheit entfernen
+    prune_json_cache(cache, CACHE_TTL)
 
 
 # ---------- main ----------
@@ -254,6 +787,10 @@ def main():
                         help="Alle Tag-Seiten scannen (langsamer). Standard: stoppt nach erstem Treffer.")
     parser.add_argument("--max-pages", type=int, default=10,
                         help="Maximale Anzahl Tag-Seiten, die abgerufen werden (Default: 10).")
+    parser.add_argument("--stop-when-complete", action="store_true",
+                        help="Mit --scan-all: abbrechen, sobald jeder lokale Digest mindestens einen Tag hat.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disk-Cache (~/.cache/local-revlookup) weder lesen noch schreiben.")
 
     # Wenn ohne Parameter aufgerufen → Hilfe + Beispiele ausgeben und beenden
     if len(sys.argv) == 1:
@@ -287,25 +824,48 @@ def main():
                     "mapping_possible": False,
                     "note": msg,
                 }
-                print(json.dumps(payload, indent=2, ensure_ascii=False))
+                emit_json(payload)
                 sys.exit(0)
             else:
-                print(f"Image: {args.ref}")
-                print(f"Repository: {out_repo}")
+                lines = [f"Image: {args.ref}", f"Repository: {out_repo}"]
                 if local_id:
-                    print(f"Lokale .Id: {local_id}")
-                print(msg)
+                    lines.append(f"Lokale .Id: {local_id}")
+                lines.append(msg)
+                emit(lines)
                 sys.exit(0)
 
         LOG.info("Lokale RepoDigest(s): %s", ", ".join(sorted(repo_digests)))
 
-        # 2) Tags auf Docker Hub dazu finden (mit Early-Exit/Scan-All und max-pages)
-        tags = collect_hub_tags_for_digests(
-            hub_repo,
-            repo_digests,
-            scan_all=args.scan_all,
-            max_pages=args.max_pages
-        )
+        # 2) Tags auf Docker Hub dazu finden (mit Early-Exit/Scan-All und max-pages);
+        #    Digests sind unveränderlich → bekannte Zuordnungen kommen aus dem Disk-Cache
+        tag_cache = {} if args.no_cache else load_json_cache(TAG_CACHE_FILE)
+        tags = lookup_cached_tags(tag_cache, hub_repo, repo_digests, scan_all=args.scan_all)
+        if tags is not None:
+            LOG.info("Tags aus Cache (%s): %s", cache_dir(), ", ".join(sorted(tags)))
+        else:
+            etag_cache = None if args.no_cache else load_json_cache(ETAG_CACHE_FILE)
+            session = HubSession(etags=etag_cache)
+            try:
+                tags, exhausted = collect_hub_tags_for_digests(
+                    session,
+                    hub_repo,
+                    repo_digests,
+                    scan_all=args.scan_all,
+                    max_pages=args.max_pages,
+                    tag=tag,
+                    stop_when_complete=args.stop_when_complete
+                )
+            finally:
+                session.close()
+            if session.etags_changed:
+                prune_json_cache(etag_cache, ETAG_TTL)
+                save_json_cache(ETAG_CACHE_FILE, etag_cache)
+            # Nur den angefragten Tag selbst (z. B. 'latest') nicht merken: die eigentliche Version
+            # wurde (noch) nicht gefunden, ein Folgelauf – etwa mit größerem --max-pages – soll neu suchen
+            if tags - {tag} and not args.no_cache:
+                store_cached_tags(tag_cache, hub_repo, repo_digests, tags,
+                                  complete=args.scan_all and exhausted)
+                save_json_cache(TAG_CACHE_FILE, tag_cache)
 
         latest, versions, others = split_latest_versions(tags)
 
@@ -322,29 +882,23 @@ def main():
                 },
                 "all_tags_sorted": sorted(tags),
                 "scan_all": args.scan_all,
+                "stop_when_complete": args.stop_when_complete,
                 "max_pages": args.max_pages,
             }
-            print(json.dumps(payload, indent=2, ensure_ascii=False))
+            emit_json(payload)
             return
 
-        # Menschliche Ausgabe
-        print(f"Image: {args.ref}")
-        print(f"Repository: {out_repo}")
-        print("Lokale RepoDigest(s):")
-        for d in sorted(repo_digests):
-            print(f"  - {d}")
-
-        print("Zugeordnete Tags auf Docker Hub:")
-        for t in versions:
-            print(f"  - {out_repo}:{t}")
-        for t in latest:
-            print(f"  - {out_repo}:{t}")
-        for t in others:
-            print(f"  - {out_repo}:{t}")
+        # Menschliche Ausgabe – gesammelt und mit einem einzigen write() ausgegeben
+        lines = [f"Image: {args.ref}", f"Repository: {out_repo}", "Lokale RepoDigest(s):"]
+        lines.extend(f"  - {d}" for d in sorted(repo_digests))
+
+        lines.append("Zugeordnete Tags auf Docker Hub:")
+        lines.extend(f"  - {out_repo}:{t}" for t in (*versions, *latest, *others))
 
         preferred = versions[-1] if versions else (latest[0] if latest else (others[0] if others else None))
         if preferred:
-            print(f"\n=> Wahrscheinlich verwendete Version/ID: {preferred}")
+            lines.append(f"\n=> Wahrscheinlich verwendete Version/ID: {preferred}")
+        emit(lines)
 
     except FileNotFoundError:
         print("Fehler: 'docker' CLI nicht gefunden. Bitte Docker installieren/ PATH prüfen.", file=sys.stderr)